@@ -1,7 +1,18 @@
 import os
+import csv
+import functools
+import shutil
 import logging
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from sqlalchemy import Engine, create_engine
+from pandas._libs.parsers import STR_NA_VALUES
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+from sqlalchemy import Connection, Engine, create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 
 #########################################################
@@ -48,6 +59,8 @@ def crear_conexion(nombre_bbdd: str) -> Engine:
     - Utiliza autenticación integrada de Windows (trusted_connection).
     - El servidor se obtiene automáticamente con os.getlogin().
     - Usa el driver ODBC 17 para SQL Server.
+    - Activa `fast_executemany` de pyodbc para que las inserciones masivas se envíen
+    en lotes en lugar de fila a fila.
 
     Lanza:
     - SQLAlchemyError: Si ocurre un error al crear la conexión.
@@ -58,7 +71,7 @@ def crear_conexion(nombre_bbdd: str) -> Engine:
     driver = 'ODBC+Driver+17+for+SQL+Server'
     conn_str = f"mssql+pyodbc://@{server}/{nombre_bbdd}?trusted_connection=yes&driver={driver}"
     try:
-        engine = create_engine(conn_str)
+        engine = create_engine(conn_str, fast_executemany=True)
         logging.info("Conexion establecida con %s", nombre_bbdd)
         return engine
     except SQLAlchemyError as err:
@@ -68,7 +81,16 @@ def crear_conexion(nombre_bbdd: str) -> Engine:
 #########################################################
 # Leer CSV y exportar a CSV
 #########################################################
-def leer_datos(ruta_csv: str, convertir_fecha: bool = False, columna_fecha: str = 'Date') -> pd.DataFrame:
+# Esquema de los CSV de ventas: columnas que se leen y su tipo (texto; se limpian en la transformación)
+ESQUEMA_VENTAS = {
+    'Sale_ID': 'string[pyarrow]',
+    'Product': 'string[pyarrow]',
+    'Amount': 'string[pyarrow]',
+    'Date': 'string[pyarrow]'
+}
+
+def leer_datos(ruta_csv: str, convertir_fecha: bool = False, columna_fecha: str = 'Date',
+               esquema: dict[str, str] | None = None) -> pd.DataFrame:
     """
     Lee un archivo CSV y lo convierte en un DataFrame de pandas.
     Puede convertir una columna a tipo datetime si se especifica.
@@ -79,6 +101,8 @@ def leer_datos(ruta_csv: str, convertir_fecha: bool = False, columna_fecha: str
     Por defecto es False.
     - columna_fecha (str): Nombre de la columna a convertir si convertir_fecha es True. 
     Por defecto es 'Date'.
+    - esquema (dict | None): Columnas a leer y su tipo (por ejemplo, `ESQUEMA_VENTAS`). 
+    Si se indica, solo se leen esas columnas y no se infieren tipos. Por defecto es None.
 
     Retorna:
     - DataFrame con los datos del archivo CSV.
@@ -92,11 +116,14 @@ def leer_datos(ruta_csv: str, convertir_fecha: bool = False, columna_fecha: str
     - Exception: Si ocurre un error al leer el archivo.
     """
     try:
-        df = pd.read_csv(ruta_csv)
+        if esquema is not None:
+            df = pd.read_csv(ruta_csv, dtype=esquema, usecols=list(esquema), engine='c', memory_map=True)
+        else:
+            df = pd.read_csv(ruta_csv)
         logging.info("CSV cargado correctamente: %s (filas=%d)", ruta_csv, len(df))
 
         if convertir_fecha and columna_fecha in df.columns:
-            df[columna_fecha] = pd.to_datetime(df[columna_fecha], format='%Y-%m-%d', errors='coerce')
+            df[columna_fecha] = pd.to_datetime(df[columna_fecha], format='%Y-%m-%d', errors='coerce', cache=True)
             logging.info("Columna '%s' convertida a datetime", columna_fecha)
 
         return df
@@ -131,38 +158,236 @@ def exportar_a_csv(df: pd.DataFrame, ruta_csv: str) -> None:
 #########################################################
 # CARGAR A BDD
 #########################################################
-def cargar_en_bdd(df: pd.DataFrame, nombre_tabla: str, engine: Engine, modo: str = 'replace') -> None:
+def cargar_en_bdd(df: pd.DataFrame, nombre_tabla: str, engine: Engine | Connection, modo: str = 'replace',
+                  tamano_lote: int = 10_000) -> None:
     """
     Inserta un DataFrame en una tabla de SQL Server utilizando SQLAlchemy.
 
     Parámetros:
     - df (pd.DataFrame): DataFrame con los datos a insertar.
     - nombre_tabla (str): Nombre de la tabla de destino en la base de datos.
-    - engine (sqlalchemy.Engine): Objeto de conexión SQLAlchemy.
+    - engine (sqlalchemy.Engine | sqlalchemy.Connection): Objeto de conexión SQLAlchemy. 
+    Si es una Connection (por ejemplo, de `engine.begin()`), la inserción forma parte de su transacción.
     - modo (str): Modo de inserción:
         - 'replace': Elimina la tabla si existe y la crea de nuevo.
         - 'append': Añade los datos al final de la tabla existente.
     Por defecto, 'replace'.
+    - tamano_lote (int): Número de filas enviadas en cada lote. Por defecto, 10000.
 
     Detalles:
     - No inserta el índice del DataFrame.
     - Utiliza `to_sql()` de pandas con el motor SQLAlchemy.
+    - Con `fast_executemany` activo en el engine, cada lote viaja en un único envío
+    a SQL Server en vez de una inserción por fila.
     - Registra en el log la operación realizada y el número de filas insertadas.
 
     Lanza:
     - Exception: Si ocurre un error durante la inserción en la base de datos.
     """
     try:
-        df.to_sql(name=nombre_tabla, con=engine, if_exists=modo, index=False)
+        df.to_sql(name=nombre_tabla, con=engine, if_exists=modo, index=False, chunksize=tamano_lote)
         logging.info("Insertado en BDD: tabla=%s, filas=%d, modo=%s", nombre_tabla, len(df), modo)
     except Exception as e:
         logging.error("ERROR: error al insertar en la BBDD '%s': %s", nombre_tabla, e, exc_info=True)
         raise
 
+# Número mínimo de filas a partir del cual compensa cargar con bcp en vez de to_sql
+MIN_FILAS_BCP = 10_000
+
+def _texto_no_apto_para_bcp(df: pd.DataFrame) -> bool:
+    """
+    Indica si alguna columna de texto contiene tabuladores, saltos de línea o comillas,
+    caracteres que romperían el fichero separado por tabuladores que carga `bcp -c`,
+    o textos vacíos, que `bcp -c` guardaría como NULL en vez de ''.
+    """
+    for columna in df.select_dtypes(include=['object', 'string']).columns:
+        if df[columna].astype('string').str.contains(r'[\t\r\n"]|^$', regex=True, na=False).any():
+            return True
+    return False
+
+@functools.cache
+def _bcp_disponible() -> bool:
+    """
+    Indica si en el PATH está el `bcp` de SQL Server (y no otro programa con el mismo nombre,
+    como el `bcp` de Boost). Se comprueba una sola vez con `bcp -v`.
+    """
+    if shutil.which('bcp') is None:
+        return False
+    try:
+        version = subprocess.run(['bcp', '-v'], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return 'Microsoft SQL Server' in version.stdout
+
+def se_puede_usar_bcp(df: pd.DataFrame, min_filas: int = MIN_FILAS_BCP) -> bool:
+    """
+    Indica si `cargar_en_bdd_bulk` cargaría el DataFrame con `bcp` o caería en `cargar_en_bdd`.
+
+    Parámetros:
+    - df (pd.DataFrame): DataFrame que se quiere cargar.
+    - min_filas (int): Número mínimo de filas para usar `bcp`. Por defecto, 10000.
+
+    Retorna:
+    - True si tiene al menos `min_filas` filas, el `bcp` del PATH es el de SQL Server
+    y ningún texto está vacío ni contiene tabuladores, saltos de línea o comillas.
+    """
+    return len(df) >= min_filas and _bcp_disponible() and not _texto_no_apto_para_bcp(df)
+
+def cargar_en_bdd_bulk(df: pd.DataFrame, nombre_tabla: str, engine: Engine, modo: str = 'replace',
+                       min_filas: int = MIN_FILAS_BCP) -> None:
+    """
+    Inserta un DataFrame en SQL Server mediante la utilidad `bcp` (carga masiva).
+
+    Parámetros:
+    - df (pd.DataFrame): DataFrame con los datos a insertar.
+    - nombre_tabla (str): Nombre de la tabla de destino en la base de datos.
+    - engine (sqlalchemy.Engine): Objeto Engine de SQLAlchemy. `bcp` es un proceso aparte y
+    no puede entrar en una transacción abierta, así que se usa fuera de `engine.begin()`.
+    - modo (str): 'replace' o 'append', igual que en `cargar_en_bdd`. Por defecto, 'replace'.
+    - min_filas (int): Número mínimo de filas para usar `bcp`. Por defecto, 10000.
+
+    Detalles:
+    - Crea una tabla auxiliar '<nombre_tabla>_bcp' con la estructura del DataFrame,
+    vuelca los datos a un fichero temporal separado por tabuladores y los carga en ella con `bcp`,
+    sin pasar por los parámetros de ODBC.
+    - Solo cuando `bcp` termina bien, la tabla auxiliar sustituye a la de destino ('replace')
+    o se añade a ella ('append') en una única transacción. Si `bcp` falla, la tabla de destino
+    no se ha tocado: se borra la auxiliar y se carga con `cargar_en_bdd`.
+    - Si `se_puede_usar_bcp` devuelve False (menos de `min_filas` filas, el `bcp` del PATH no es
+    el de SQL Server o algún texto está vacío o contiene tabuladores, saltos de línea o comillas,
+    que `bcp -c` no sabe escapar), usa `cargar_en_bdd` directamente.
+    - Registra en el log la operación realizada y el número de filas insertadas.
+
+    Lanza:
+    - Exception: Si ocurre un error durante la inserción en la base de datos.
+    """
+    if not se_puede_usar_bcp(df, min_filas):
+        cargar_en_bdd(df, nombre_tabla, engine, modo)
+        return
+
+    tabla_aux = f'{nombre_tabla}_bcp'
+    fd, ruta_tmp = tempfile.mkstemp(suffix='.tsv')
+    os.close(fd)
+    try:
+        df.head(0).to_sql(name=tabla_aux, con=engine, if_exists='replace', index=False)
+        # bcp -c no entiende las comillas de CSV: escribimos los valores tal cual
+        df.to_csv(ruta_tmp, sep='\t', index=False, header=False, date_format='%Y-%m-%d',
+                  encoding='utf-8', quoting=csv.QUOTE_NONE)
+        subprocess.run(
+            ['bcp', tabla_aux, 'in', ruta_tmp,
+             '-S', engine.url.host, '-d', engine.url.database, '-T',
+             '-c', '-C', '65001', '-t', '\t', '-b', '50000'],
+            check=True, capture_output=True, text=True
+        )
+    except subprocess.CalledProcessError as e:
+        logging.warning("bcp fallo al insertar en '%s', se carga con to_sql: %s", nombre_tabla, e.stdout or e.stderr)
+        with engine.begin() as conexion:
+            conexion.execute(text(f'DROP TABLE IF EXISTS [{tabla_aux}]'))
+        cargar_en_bdd(df, nombre_tabla, engine, modo)
+        return
+    except Exception as e:
+        logging.error("ERROR: error al insertar en la BBDD '%s': %s", nombre_tabla, e, exc_info=True)
+        raise
+    finally:
+        os.remove(ruta_tmp)
+
+    try:
+        # Pasamos los datos de la tabla auxiliar a la de destino en una sola transacción
+        with engine.begin() as conexion:
+            if modo == 'replace':
+                conexion.execute(text(f'DROP TABLE IF EXISTS [{nombre_tabla}]'))
+                conexion.execute(text('EXEC sp_rename :origen, :destino'),
+                                 {'origen': tabla_aux, 'destino': nombre_tabla})
+            else:
+                df.head(0).to_sql(name=nombre_tabla, con=conexion, if_exists='append', index=False)
+                conexion.execute(text(f'INSERT INTO [{nombre_tabla}] SELECT * FROM [{tabla_aux}]'))
+                conexion.execute(text(f'DROP TABLE [{tabla_aux}]'))
+        logging.info("Insertado en BDD con bcp: tabla=%s, filas=%d, modo=%s", nombre_tabla, len(df), modo)
+    except Exception as e:
+        logging.error("ERROR: error al insertar en la BBDD '%s': %s", nombre_tabla, e, exc_info=True)
+        raise
+
 #########################################################
 # LEER VARIOS CSV
 #########################################################
 
+# Tipos de Arrow de las columnas de ventas (todas se leen como texto y se limpian después).
+# large_string es el tipo que usa 'string[pyarrow]' por dentro: así to_pandas no vuelve a copiar los textos
+_TIPOS_CSV = {columna: pa.large_string() for columna in ESQUEMA_VENTAS}
+
+# Textos que pandas lee como nulos por defecto ('', 'NA', 'None', '<NA>', 'NULL', 'nan'...);
+# los de Arrow son otros, así que le pasamos los mismos para que los nulos no cambien
+_VALORES_NULOS = sorted(STR_NA_VALUES)
+
+# Opciones de lectura de PyArrow: bloques de 32 MB y los mismos textos nulos que pandas
+_OPCIONES_LECTURA = pacsv.ReadOptions(use_threads=True, block_size=32 << 20)
+_OPCIONES_CONVERSION = pacsv.ConvertOptions(
+    column_types=_TIPOS_CSV, null_values=_VALORES_NULOS, strings_can_be_null=True
+)
+# Lectura archivo a archivo: solo las columnas del esquema (las que falten se crean vacías)
+_OPCIONES_CONVERSION_FICHERO = pacsv.ConvertOptions(
+    column_types=_TIPOS_CSV, null_values=_VALORES_NULOS, strings_can_be_null=True,
+    include_columns=list(_TIPOS_CSV), include_missing_columns=True
+)
+
+# Conversión de los tipos de Arrow a pandas: los textos usan el dtype 'string[pyarrow]'
+_TIPOS_PANDAS = {pa.large_string(): pd.StringDtype('pyarrow')}
+
+def _audit_date(archivo: str) -> pd.Timestamp:
+    """
+    Devuelve la fecha de auditoría sacada del nombre del archivo sin extensión.
+    Si el nombre no es una fecha, devuelve NaT.
+    """
+    return pd.to_datetime(os.path.splitext(archivo)[0], errors='coerce')
+
+def _leer_carpeta_csv(rutas_csv: list[str]) -> pa.Table:
+    """
+    Lee todos los CSV de una vez como un dataset de PyArrow, que reparte los archivos y
+    bloques entre hilos, y añade 'Audit_Date' según el archivo del que viene cada lote.
+    Lanza la excepción de PyArrow si algún archivo no se puede leer.
+    """
+    audit_dates = {os.path.basename(ruta): _audit_date(os.path.basename(ruta)) for ruta in rutas_csv}
+    formato = ds.CsvFileFormat(read_options=_OPCIONES_LECTURA, convert_options=_OPCIONES_CONVERSION)
+    # Esquema fijo con las columnas de ventas: no depende del primer archivo y las columnas
+    # que falten en un archivo llegan como nulos, sea cual sea el orden de la carpeta
+    esquema = pa.schema(list(_TIPOS_CSV.items()))
+    dataset = ds.dataset(rutas_csv, format=formato, schema=esquema)
+
+    lotes, fechas_lote, filas_lote = [], [], []
+    for lote in dataset.scanner(use_threads=True).scan_batches():
+        lotes.append(lote.record_batch)
+        fechas_lote.append(audit_dates[os.path.basename(lote.fragment.path)])
+        filas_lote.append(lote.record_batch.num_rows)
+
+    for ruta in rutas_csv:
+        logging.info("Archivo cargado correctamente: %s", os.path.basename(ruta))
+
+    # 'Audit_Date' se crea una sola vez para toda la tabla (la fecha de cada lote repetida por sus filas),
+    # en vez de un array completo por lote antes de concatenar
+    audit_date = np.repeat(pd.DatetimeIndex(fechas_lote, dtype='datetime64[ns]').to_numpy(), filas_lote)
+    tabla = pa.Table.from_batches(lotes, schema=esquema)
+    return tabla.append_column('Audit_Date', pa.array(audit_date, from_pandas=True))
+
+def _leer_fichero_csv(ruta_completa: str) -> pa.Table | None:
+    """
+    Lee un CSV con PyArrow y le añade la columna 'Audit_Date' a partir del nombre del archivo.
+    Devuelve None (y lo registra en el log) si el archivo no se puede leer.
+    """
+    archivo = os.path.basename(ruta_completa)
+
+    try:
+        tabla = pacsv.read_csv(
+            ruta_completa, read_options=_OPCIONES_LECTURA, convert_options=_OPCIONES_CONVERSION_FICHERO
+        )
+        audit_date = _audit_date(archivo)
+        audit_date = pa.scalar(None if pd.isna(audit_date) else audit_date, type=pa.timestamp('ns'))
+        tabla = tabla.append_column('Audit_Date', pa.repeat(audit_date, tabla.num_rows))
+        logging.info("Archivo cargado correctamente: %s", archivo)
+        return tabla
+    except Exception as e:
+        logging.warning("Error al leer %s: %s", archivo, e)
+        return None
+
 def cargar_ficheros_en_dataframe(ruta_directorio: str) -> pd.DataFrame:
     """
     Carga todos los CSV de la carpeta, añade columna 'Audit_Date' con la fecha
@@ -174,27 +399,41 @@ def cargar_ficheros_en_dataframe(ruta_directorio: str) -> pd.DataFrame:
     Retorna:
     - Un único DataFrame con todos los datos y columna 'Audit_Date' añadida.
 
+    Detalles:
+    - Todos los CSV se leen en una sola pasada como dataset de PyArrow, que paraleliza
+    entre archivos y bloques de 32 MB sin un bucle de Python por archivo.
+    - Si algún archivo falla, se vuelven a leer uno a uno en paralelo (hasta 8 hilos)
+    para saltar solo los archivos erróneos.
+    - Las tablas de Arrow se concatenan, se juntan en un único bloque por columna
+    y se convierten a pandas una sola vez.
+    - Solo se leen las columnas de `ESQUEMA_VENTAS`, todas como texto y sin inferir tipos,
+    para que todas las tablas tengan el mismo esquema; llegan a pandas como 'string[pyarrow]'
+    (buffers contiguos de Arrow en lugar de un objeto de Python por celda).
+
     Logging:
     - Registra errores y exito en la lectura.
     """
-    dataframes = []
-
     try:
-        for archivo in os.listdir(ruta_directorio):
-            if archivo.endswith('.csv'):
-                ruta_completa = os.path.join(ruta_directorio, archivo)
-                nombre_archivo = os.path.splitext(archivo)[0]
-
-                try:
-                    df = pd.read_csv(ruta_completa)
-                    df['Audit_Date'] = pd.to_datetime(nombre_archivo, errors='coerce')
-                    dataframes.append(df)
-                    logging.info("Archivo cargado correctamente: %s", archivo)
-                except Exception as e:
-                    logging.warning("Error al leer %s: %s", archivo, e)
-
-        if dataframes:
-            df_final = pd.concat(dataframes, ignore_index=True)
+        rutas_csv = [
+            os.path.join(ruta_directorio, archivo)
+            for archivo in os.listdir(ruta_directorio)
+            if archivo.endswith('.csv')
+        ]
+
+        tablas = []
+        if rutas_csv:
+            try:
+                tablas = [_leer_carpeta_csv(rutas_csv)]
+            except Exception as e:
+                logging.warning("No se pudo leer la carpeta de una vez, se leen los archivos uno a uno: %s", e)
+                with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+                    tablas = [tabla for tabla in executor.map(_leer_fichero_csv, rutas_csv) if tabla is not None]
+
+        if tablas:
+            # Unimos los bloques de cada columna en uno solo: los textos se quedan en Arrow
+            # ('string[pyarrow]') y así las operaciones posteriores trabajan sobre memoria contigua
+            tabla_final = pa.concat_tables(tablas, promote_options='default').combine_chunks()
+            df_final = tabla_final.to_pandas(self_destruct=True, types_mapper=_TIPOS_PANDAS.get)
             logging.info("Todos los archivos fueron combinados en un unico DataFrame")
             return df_final
         else:
@@ -203,4 +442,4 @@ def cargar_ficheros_en_dataframe(ruta_directorio: str) -> pd.DataFrame:
 
     except Exception as e:
         logging.exception("Fallo general al procesar la carpeta de CSV: %s", e)
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
@@ -1,14 +1,19 @@
 # Como ya tengo un archivo utils con funciones para extracción, carga, logging, etc., las reutilizo
 import os
+import re
 import logging
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
 from etl_utils import (
     configurar_logging,
     crear_conexion,
     exportar_a_csv,
     cargar_en_bdd,
+    cargar_en_bdd_bulk,
+    se_puede_usar_bcp,
     cargar_ficheros_en_dataframe
 )
 
@@ -46,55 +51,65 @@ df_principal = cargar_ficheros_en_dataframe(ruta_csv)
 # FASE DE TRANSFORMACIÓN (T) – LIMPIEZA VALIDAS
 ################################################
 
-# Primero hacemos una copia del df original para trabajar con los arreglos para Vetas_validas
-df_validas = df_principal.copy()
+# Regex para separar el valor numérico de la divisa (USD, EUR o sin divisa).
+# Es un texto y no un re.compile: la ejecuta Arrow (sintaxis RE2), no el módulo re de Python
+_RE_AMOUNT = r'^\s*(?P<valor>[-+]?(?:\d+\.?\d*|\.\d+))\s*(?P<divisa>USD|EUR)?\s*$'
+
+# Regex para quedarnos con el último tramo de Product tras el último '-', sin espacios en los extremos
+_RE_PRODUCT = re.compile(r'^\s*(?:.*-)?([^-]*?)\s*$')
 
 # Difinimos la funcion
 def limpiar_ventas_validas(df_principal: pd.DataFrame) -> pd.DataFrame:
-    # reservamos el original
-    df = df_principal.copy()  
+    # reservamos el original (copia superficial: cada arreglo crea columnas nuevas sin tocar df_principal)
+    df = df_principal.copy(deep=False)
+    # Vamos acumulando en una sola máscara las filas que se quedan y filtramos una única vez al final,
+    # en vez de copiar el DataFrame entero en cada paso
 
 ####### ARREGLOS SALE_ID #######
     # Ponemos en mayus
     df['Sale_ID'] = df['Sale_ID'].str.upper() 
-    # Quitamos nulos
-    df = df[df['Sale_ID'].notna()] 
-    # Quitamos duplicados
-    df = df.drop_duplicates(subset=['Sale_ID'], keep='first') 
+    # Quitamos nulos y duplicados (nos quedamos con la primera aparición) con una sola pasada de hash:
+    # factorize numera los Sale_ID por orden de aparición (-1 = nulo), así que una fila es la primera
+    # de su Sale_ID cuando su código supera a todos los anteriores (el máximo acumulado sube)
+    codigos_id, _ = pd.factorize(df['Sale_ID'], sort=False)
+    primera_aparicion = np.diff(np.maximum.accumulate(codigos_id), prepend=-1) > 0
+    mask = pd.Series(primera_aparicion, index=df.index)
 
 ####### ARREGLOS PRODUCT #######
     # Nos quedamos solo con la letra al final de la cadena str que esta separada de la cadena por un (-)
-    df['Product'] = (df['Product'].str.upper().str.strip().str.split('-').str[-1]) 
+    # (una sola regex en vez de strip + split + [-1])
+    df['Product'] = df['Product'].str.upper().str.extract(_RE_PRODUCT, expand=False)
     # Igual que en Sales, quitamos los nulos
-    df = df[df['Product'].notna()]
+    mask &= df['Product'].notna()
 
 ####### ARREGLOS AMOUNT #######
 
 # Eliminamos los símbolos de divisas (USD, EUR) y los montos que estén en euros convertirlos a dólares, teniendo en cuenta que el cambio de dólar se puede hacer multiplicando el valor por 0.85.
-    # Guard el valor de amount para mas adelante
-    df_amount_original = df['Amount'] 
-    # Quitamos las siglas del final de la cadena para poder trabajar con los valores
-    df['Amount_arreglado'] = (df['Amount'].str.replace('USD', '').str.replace('EUR', '')) 
-    # Lo convertimos en float para poder hacer calculos de decimales
-    df['Amount'] = df['Amount_arreglado'].astype(float) 
-    # Comprobamos del valor original de amount si acaba en EUR, si devuelve FALSE el amount lo multimplicamos por 1.12
-    df.loc[df_amount_original.str.endswith('EUR', na=False), 'Amount'] *= 0.85
+    # Una sola regex ejecutada por Arrow (sin crear textos de Python) separa el valor de la divisa;
+    # los valores nulos o sin formato válido no encajan y quedan como NaN
+    # (usamos pyarrow.compute directamente: str.extract de pandas recorre la columna en Python;
+    # pa.array sin type reutiliza el array de Arrow de la columna, sin copiarlo)
+    partes = pc.extract_regex(pa.array(df['Amount'], from_pandas=True), _RE_AMOUNT)
+    valores = pc.cast(pc.struct_field(partes, 'valor'), pa.float64()).to_numpy(zero_copy_only=False)
+    es_eur = pc.fill_null(pc.equal(pc.struct_field(partes, 'divisa'), 'EUR'), False).to_numpy(zero_copy_only=False)
+    valores = np.where(es_eur, valores * 0.85, valores)
     # Redondeamos el resultado a 2 decimales
-    df['Amount'] = df['Amount'].round(2) 
+    df['Amount'] = np.round(valores, 2)
     # Quitamos nulos
-    df = df[df['Amount'].notna()] 
-    # Elimino la tabla temporal que ya no necesitaremos
-    df.drop(columns=['Amount_arreglado'], inplace=True) 
+    mask &= df['Amount'].notna()
 
 ####### ARREGLOS DATE #######
 
 # Convertimos a datetime 
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    # (formato fijo: no se infiere, y cache reutiliza las fechas repetidas)
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce', cache=True)
     df['Audit_Date'] = pd.to_datetime(df['Audit_Date'], errors='coerce')
 
     # Quitamos los nulos
-    df = df[df['Date'].notna()]
-    df = df[df['Audit_Date'].notna()]
+    mask &= df['Date'].notna() & df['Audit_Date'].notna()
+
+    # Filtramos una sola vez con todas las condiciones
+    df = df[mask]
 
     logging.info("Ventas validas: Sale_ID todo mayusculas, hemos eliminado nulos y duplicados, Product y Amount arreglados (filas=%d)",len(df))
     return df
@@ -103,46 +118,56 @@ def limpiar_ventas_validas(df_principal: pd.DataFrame) -> pd.DataFrame:
 # FASE DE TRANSFORMACIÓN – LIMPIEZA INVALIDAS
 ################################################
 
+# Motivos de invalidez: N (nulos), A (monto inválido), D (duplicados). El código de cada fila es su posición aquí
+_REASON = pd.CategoricalDtype(['N', 'A', 'D'])
+
 def limpiar_ventas_invalidas(df_principal: pd.DataFrame) -> pd.DataFrame:
     try:
-        df = df_principal.copy()
+        df = df_principal.copy(deep=False)
         logging.info("Iniciando deteccion de ventas invalidas")
 
-        # Limpieza Sale_ID y Product
-        df['Sale_ID'] = df['Sale_ID'].astype(str).str.upper()
-        df['Product'] = df['Product'].astype(str).str.split('-').str[-1].str.upper()
+        # Limpieza Sale_ID y Product (los nulos quedan como texto 'NAN', igual que con astype(str))
+        # Product: último tramo tras el '-' con una regex, para que siga siendo texto de Arrow
+        df['Sale_ID'] = df['Sale_ID'].fillna('nan').str.upper()
+        df['Product'] = df['Product'].fillna('nan').str.extract(r'([^-]*)$', expand=False).str.upper()
 
-        df_invalidas = pd.DataFrame()
+        # Calculamos las tres máscaras sobre el DataFrame completo, sin crear DataFrames intermedios
+        n = len(df)
 
         # REASON N: NULOS
-        #Sacamos las filas donde hay al menos un valor nulo con una mascara y le añado una columna Reason con valor N 
-        mask_nulos = df.isnull().any(axis=1)
-        df_nulos = df[mask_nulos].copy()
-        df_nulos['Reason'] = 'N'
+        # Filas donde hay al menos un valor nulo
+        mask_nulos = df.isnull().any(axis=1).to_numpy()
 
         # REASON A: MONTO INVÁLIDA
-        # Ahora me quedo solo con las filas que no tenían nulos, reviso su columna Amount, si no pone 'USD' o 'EUR', entonces es un monto inválido.
-        df_no_nulos = df[~mask_nulos].copy()
-        # COnvertimos Amount en mayúsculas para facilitar la detección de la moneda (USD o EUR)
-        df_no_nulos['Amount_str'] = df_no_nulos['Amount'].astype(str).str.upper()
-        # Creamos una máscara para identificar filas cuyo Amount no contiene una monedaa válida (ni USD ni EUR
-        mask_monto_invalido = ~df_no_nulos['Amount_str'].str.contains('USD|EUR', na=False)
-        df_monto_invalido = df_no_nulos[mask_monto_invalido].copy()
-        df_monto_invalido['Reason'] = 'A'
+        # De las filas que no tenían nulos, si Amount no pone 'USD' o 'EUR' (en mayúsculas), entonces es un monto inválido.
+        amount_str = df['Amount'].str.upper()
+        con_divisa = amount_str.str.contains('USD|EUR', na=False).to_numpy(dtype=bool)
+        # También lo es si no encaja en _RE_AMOUNT (por ejemplo '12.5usd' o '1,5 EUR'): limpiar_ventas_validas
+        # lo descarta, así que lo marcamos aquí para que no desaparezca de las dos salidas
+        amount_arrow = pa.array(df['Amount'], from_pandas=True)
+        con_formato = pc.fill_null(pc.match_substring_regex(amount_arrow, _RE_AMOUNT), False).to_numpy(zero_copy_only=False)
+        mask_monto_invalido = ~mask_nulos & ~(con_divisa & con_formato)
 
         # REASON D: DUPLICADOS
-        df_restantes = df_no_nulos[~mask_monto_invalido].copy()
-        # COgemos solo las filas que tiene  en Sale_ID duplicados y ponemos en Reason 'D'
-        duplicados = df_restantes[df_restantes.duplicated(subset='Sale_ID', keep=False)]
-        df_duplicados = duplicados.copy()
-        df_duplicados['Reason'] = 'D'
+        # Solo entre las filas restantes (sin nulos y con moneda válida) buscamos Sale_ID duplicados
+        mask_restantes = ~mask_nulos & ~mask_monto_invalido
+        mask_duplicados = np.zeros(n, dtype=bool)
+        mask_duplicados[mask_restantes] = df.loc[mask_restantes, 'Sale_ID'].duplicated(keep=False).to_numpy()
+
+        # Código del motivo por fila (-1 = fila válida), en el mismo orden que las categorías de _REASON
+        codigos = np.full(n, -1, dtype=np.int8)
+        codigos[mask_nulos] = 0
+        codigos[mask_monto_invalido] = 1
+        codigos[mask_duplicados] = 2
 
         # UNIMOS TODAS LAS INVÁLIDAS
-        df_invalidas = pd.concat([df_nulos, df_monto_invalido, df_duplicados], ignore_index=True)
+        # Filtramos una sola vez, manteniendo el orden N, A, D y dentro de cada motivo el orden original
+        seleccion = np.flatnonzero(codigos >= 0)
+        seleccion = seleccion[np.argsort(codigos[seleccion], kind='stable')]
+        df_invalidas = df.iloc[seleccion].reset_index(drop=True)
+        # Reason como categoría: 1 byte por fila (el código) en lugar de un texto por fila
+        df_invalidas['Reason'] = pd.Categorical.from_codes(codigos[seleccion], dtype=_REASON)
 
-        # Eliminamos la columna extra que utilizamos antes para el arreglo
-        if 'Amount_str' in df_invalidas.columns:
-            df_invalidas.drop(columns=['Amount_str'], inplace=True)
         logging.info("Ventas invalidas detectadas: %d filas", len(df_invalidas))
         return df_invalidas
     
@@ -155,18 +180,22 @@ def limpiar_ventas_invalidas(df_principal: pd.DataFrame) -> pd.DataFrame:
 ################################################
 def generar_ventas_resumen_mensual(df: pd.DataFrame) -> pd.DataFrame:
     try:
-        # Creamos una copia del DataFrame original
-        df = df.copy()
         # Registramos en el log que comienza la generación del resumen mensual
         logging.info("Generando informe agregado mensual")
 
-        # Creamos una nueva columna 'Mes' extrayendo el mes y año en formato MM/YYYY desde la columna 'Date'
-        df['Mes'] = df['Date'].dt.strftime('%m/%Y')
+        # Sacamos el mes de la columna 'Date' como periodo mensual (entero por debajo, sin crear textos por fila)
+        mes = df['Date'].dt.to_period('M').rename('Mes')
 
         # Agrupamos los datos por 'Mes' y 'Product' y calculamos la suma, el conteo y el mínimo del campo 'Amount'
-        resumen = df.groupby(['Mes', 'Product'], as_index=False).agg({
-            'Amount': ['sum', 'count', 'min']
-        })
+        resumen = (
+            df.groupby([mes, 'Product'], observed=True, sort=False)['Amount']
+            .agg(['sum', 'count', 'min'])
+            .reset_index()
+        )
+
+        # Pasamos el mes a formato MM/YYYY solo en el resumen y ordenamos como antes (por texto de 'Mes' y 'Product')
+        resumen['Mes'] = resumen['Mes'].dt.strftime('%m/%Y')
+        resumen = resumen.sort_values(['Mes', 'Product'], ignore_index=True)
 
         # Renombramos columnas
         resumen.columns = ['Mes', 'Producto', 'Ventas_Totales', 'Numero_Transacciones', 'Venta_Minima']
@@ -199,28 +228,56 @@ dataframes_finales = [
 # FORATEAMOS FECHAS PARA QUE NO APAREZCN HORAS
 ###############################################
 def formatear_fechas(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    columnas_fecha = [col for col in ['Date', 'Audit_Date'] if col in df.columns]
+    # Si no hay columnas de fecha no hace falta copiar nada
+    if not columnas_fecha:
+        return df
+    df = df.copy(deep=False)
     # Recorremos las columnas 'Date' y 'Audit_Date'
-    for col in ['Date', 'Audit_Date']:
-        if col in df.columns:
-            # Aseguramos que estén en formato datetime
-            df[col] = pd.to_datetime(df[col], errors='coerce') 
-            # Convertimos la fecha al formato 'yyyy-mm-dd' (sin horas)
-            df[col] = df[col].dt.strftime('%Y-%m-%d')
+    for col in columnas_fecha:
+        # Aseguramos que estén en formato datetime (si ya lo están no volvemos a convertir)
+        if df[col].dtype.kind != 'M':
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        # Convertimos la fecha al formato 'yyyy-mm-dd' (sin horas) con un único cast de numpy
+        valores = df[col].to_numpy()
+        fechas = valores.astype('datetime64[D]').astype('U10').astype(object)
+        # Los NaT quedan como nulos, igual que con strftime
+        fechas[np.isnat(valores)] = np.nan
+        df[col] = fechas
     return df
 
+###############################################
+## FORMATEAMOS UNA SOLA VEZ PARA CARGA Y EXPORTACIÓN
+###############################################
+# Las dos salidas usan el mismo texto 'yyyy-mm-dd', así que formateamos una vez y reutilizamos el resultado
+dataframes_formateados = [(nombre, formatear_fechas(df)) for nombre, df in dataframes_finales]
+
+# Liberamos los DataFrames sin formatear (y el original) para no tener dos versiones en memoria durante la carga
+del df_principal, df_validas, df_invalidas, df_resumen, dataframes_finales
+
 ###############################################
 ## CARGA EN BDD (con el arreglo de fechas)
 ###############################################
-for nombre_tabla, df in dataframes_finales:
-    df_formateado = formatear_fechas(df)
-    cargar_en_bdd(df_formateado, nombre_tabla, engine)
+# Decidimos antes de abrir la transacción qué tablas se cargarán de verdad con bcp
+# (grandes, con el bcp de SQL Server instalado y texto apto); el resto va con to_sql
+tablas_bcp, tablas_to_sql = [], []
+for nombre_tabla, df_formateado in dataframes_formateados:
+    (tablas_bcp if se_puede_usar_bcp(df_formateado) else tablas_to_sql).append((nombre_tabla, df_formateado))
+
+# Las cargas con to_sql van en una única transacción (una conexión y un solo commit al final)
+with engine.begin() as conexion:
+    for nombre_tabla, df_formateado in tablas_to_sql:
+        cargar_en_bdd(df_formateado, nombre_tabla, conexion)
+
+# bcp usa su propia conexión: lo lanzamos cuando la transacción ya está confirmada,
+# para que no se bloquee esperando al DDL pendiente de esa transacción
+for nombre_tabla, df_formateado in tablas_bcp:
+    cargar_en_bdd_bulk(df_formateado, nombre_tabla, engine)
 
 ###############################################
 ## Exportar a CSV (con el arreglo de fechas)
 ###############################################
-for nombre_archivo, df in dataframes_finales:
-    df_formateado = formatear_fechas(df)
+for nombre_archivo, df_formateado in dataframes_formateados:
     exportar_a_csv(df_formateado, f'Resultados/{nombre_archivo}.csv')
 
 ################################################